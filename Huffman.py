@@ -1,179 +1,363 @@
 # -*- coding: utf-8 -*-
 import os
-import re
-from bitstring import BitArray
-import operator
+import heapq
+import itertools
+import numpy as np
+try:
+  from numba import njit
+  HAS_NUMBA = True
+except ImportError:   # Without numba the kernels run as plain Python and encoding uses _encode_packbits
+  HAS_NUMBA = False
+  def njit(*args, **kwargs):
+    return lambda func: func
 from time import time
 
 
+PRIMARY_BITS = 9   # Bits of the first level of the decoding lookup tables
+MAX_CODE_LEN = 2 * PRIMARY_BITS   # Longest codeword allowed, so that decoding never needs more than two table levels
+CHUNK_SIZE = 1 << 20    # Bytes of the source read at a time during compression
+
+
+@njit(cache = True)
+def _encode_core(data, codes, lens, put_buffer, free_bits, out, pos):
+  # Inputs:
+  # data: uint8 array with the bytes to be encoded
+  # codes: uint64 array with the codeword of every symbol
+  # lens: uint8 array with the number of bits of the codeword of every symbol
+  # put_buffer: uint64 buffer with bits already written MSB first and not yet flushed
+  # free_bits: free bits left in put_buffer, at least 1
+  # out: preallocated uint8 array where the encoded bytes are written
+  # pos: position in out of the next byte to be written
+
+  # Outputs:
+  # pos: position in out after the encoded bytes flushed from the buffer
+  # put_buffer: bits left in the buffer, to be written after the encoded bytes
+  # free_bits: free bits left in put_buffer, at least 1
+
+  # Codewords are packed MSB first into a 64-bit buffer that is flushed 8 bytes at a time.
+  # Codewords are at most MAX_CODE_LEN bits long, which create_code_arrays enforces
+  # The 256-entry tables stay in L1 cache, so looking codewords up here is cheaper than gathering them beforehand
+  for i in range(data.size):    # Encode each symbol on the array
+    code = codes[data[i]]
+    code_len = np.int64(lens[data[i]])
+    if code_len <= free_bits:
+      free_bits -= code_len
+      put_buffer |= code << np.uint64(free_bits)
+    else:   # Codeword does not fit: fill the buffer, flush it and keep the remaining bits
+      put_buffer |= code >> np.uint64(code_len - free_bits)
+      for k in range(8):
+        out[pos + k] = (put_buffer >> np.uint64(56 - 8*k)) & np.uint64(0xFF)
+      pos += 8
+      free_bits += 64 - code_len
+      put_buffer = code << np.uint64(free_bits)
+    if free_bits == 0:    # Flush a full buffer right away so that shifts stay below 64 bits
+      for k in range(8):
+        out[pos + k] = (put_buffer >> np.uint64(56 - 8*k)) & np.uint64(0xFF)
+      pos += 8
+      free_bits = 64
+      put_buffer = np.uint64(0)
+  return pos, put_buffer, free_bits
+
+
+def _encode_packbits(data, codes, lens, put_buffer, free_bits, out, pos):
+  # Pure NumPy version of _encode_core, with the same inputs and outputs, used when numba is not installed.
+  # Symbols are mapped to their codewords with a vectorized gather, then every bit is written
+  # to its own byte of an array of bits, which is packed by np.packbits
+
+  n_buffer = 64 - int(free_bits)    # Bits already in the buffer
+  codes_out = codes[data]
+  lens_out = lens[data].astype(np.int64)
+  starts = np.cumsum(lens_out) - lens_out + n_buffer   # Position of the first bit of every codeword
+  total_bits = n_buffer + int(lens_out.sum())
+  out_bits = np.zeros(total_bits, dtype = np.uint8)
+  out_bits[:n_buffer] = (np.uint64(put_buffer) >> np.arange(63, 63 - n_buffer, -1, dtype = np.uint64)) & np.uint64(1)
+  for k in range(int(lens_out.max(initial = 0))):   # Scatter the k-th bit of every codeword long enough to have one
+    has_bit = lens_out > k
+    shifts = (lens_out[has_bit] - 1 - k).astype(np.uint64)
+    out_bits[starts[has_bit] + k] = (codes_out[has_bit] >> shifts) & np.uint64(1)
+  packed = np.packbits(out_bits)
+  n_out = total_bits // 64 * 8    # Only whole 64-bit words are flushed
+  out[pos:pos + n_out] = packed[:n_out]
+  rest = packed[n_out:].tobytes()   # The remaining bits are kept in the buffer
+  put_buffer = int.from_bytes(rest, 'big') << (64 - 8*len(rest))
+  return pos + n_out, put_buffer, 64 - (total_bits - 8*n_out)
+
+
+@njit(cache = True)
+def _decode_core(compressed, byte_pos, n_skip, n_total, lut_symb, lut_len, sub_offset, sub_bits, primary_bits, max_len, min_len):
+  # Inputs:
+  # compressed: uint8 array with the compressed file
+  # byte_pos: byte where the encoded data starts
+  # n_skip: bits of that first byte that still belong to the header
+  # n_total: number of bits to decode
+  # lut_symb, lut_len, sub_offset, sub_bits, primary_bits: two-level lookup tables (see HuffmanCode.make_lookup_tables)
+  # max_len, min_len: length of the longest and shortest codewords, at most MAX_CODE_LEN bits
+
+  # Outputs:
+  # out: uint8 array with the decoded bytes
+
+  out = np.empty(n_total // min_len, dtype = np.uint8)
+  n_out = 0
+  bit_buffer = np.int64(compressed[byte_pos]) & (0xFF >> n_skip)   # Bits read but not yet decoded
+  n_bits = 8 - n_skip   # Number of bits in the buffer
+  byte_pos += 1
+  while n_total > 0:    # Decode one whole codeword per iteration
+    while n_bits < max_len:   # Refill the buffer, with zeros past the end of the data
+      bit_buffer <<= 8
+      if byte_pos < compressed.size:
+        bit_buffer |= compressed[byte_pos]
+      n_bits += 8
+      byte_pos += 1
+    window = bit_buffer >> (n_bits - primary_bits)
+    code_len = np.int64(lut_len[window])
+    if code_len == 0:   # Longer codeword: look up the next bits in the second level table
+      n_sub = sub_bits[window]
+      if n_sub == 0:    # No codeword starts with these bits
+        raise ValueError('invalid codeword in the compressed data')
+      window = sub_offset[window] + ((bit_buffer >> (n_bits - primary_bits - n_sub)) & ((1 << n_sub) - 1))
+      code_len = np.int64(lut_len[window])
+    # Numba does not check bounds, so a corrupt file must be caught here instead of writing past out
+    if code_len == 0:
+      raise ValueError('invalid codeword in the compressed data')
+    if n_out == out.size:
+      raise ValueError('compressed data holds more symbols than expected')
+    out[n_out] = lut_symb[window]
+    n_out += 1
+    n_bits -= code_len
+    bit_buffer &= (np.int64(1) << n_bits) - 1
+    n_total -= code_len
+  return out[:n_out]
+
+
 class HuffmanCode:
   # Huffman Code implementation for 256-symbols file
-  def __init__(self):
-    # Initialization
-    self.pat = '(alpha\d+__)'   # Regex pattern for the special codes used during compression
-    self.codesnames = [f'alpha{i}__' for i in range(256)]   # Codes names used during compression, from alpha0 to alpha255 
-
   @staticmethod
-  def read_bytes(file):
+  def read_bytes(file, chunk_size = CHUNK_SIZE):
     # Inputs:
     # file: file from which bytes are read
+    # chunk_size: number of bytes read at a time, default = CHUNK_SIZE
 
     # Outputs:
-    # bitlist: list with every byte from the file in its binary form
+    # data: generator of uint8 arrays with consecutive chunks of the bytes of the file
 
     with open(file, 'rb') as f:
-        bitlist = []
-        while True:
-          byte = f.read(1)
-          if byte:
-            bitlist.append(BitArray(byte).bin)
-          else:
-            break
-        return bitlist
+      while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+          break
+        yield np.frombuffer(chunk, dtype = np.uint8)   # View each chunk as bytes without copying
 
   @staticmethod
-  def make_frequency_tuples(binary_list):
+  def make_frequency_tuples(data):
     # Inputs:
-    # binary_list: list of bytes in its binary forms
+    # data: iterable of uint8 arrays with the bytes of the file
 
     # Outputs:
-    # freqs: list of tuples with the frequency count of every distinct byte
-
-    counts = {}
-    for x in binary_list:
-      counts[x] = counts.get(x,0) + 1  # Count every symbol in the file
-    freqs = [(v, k) for k,v in counts.items()]    # Create list of tuples of the form (count, symbol)
-    total_elements = sum([i[0] for i in freqs])
-    freqs = [(i[0]/total_elements, i[1]) for i in freqs]    # Normalize frequencies in percentage
-    freqs.sort(key = operator.itemgetter(0), reverse = True)    # Sort the list from most common to least common symbol
+    # freqs: list of tuples with the count of every distinct byte
+
+    counts = np.zeros(256, dtype = np.int64)
+    for chunk in data:
+      counts += np.bincount(chunk, minlength = 256)  # Count every symbol in the file
+    freqs = [(v, k) for k,v in enumerate(counts.tolist()) if v]    # Create list of tuples of the form (count, symbol)
     return freqs
   
-  def update_dictionary(self, cd):
+  @staticmethod
+  def create_code_arrays(freqs):
     # Inputs:
-    # cd: current encoding dictionary
+    # freqs: frequency tuples of the form (count, symbol)
 
     # Outputs:
-    # cd: the input dictionary with the codes already defined substituted by its values
+    # code: uint64 array with the codeword of every symbol as an integer
+    # clen: uint8 array with the number of bits of the codeword of every symbol (0 if the symbol is absent)
 
-    for i in cd:
-      match = re.match(self.pat, cd[i])   # Check if current symbol possesses an 
-                                            # special symbol in its code (eg 'alpha1': 'alpha2' + '0')
-      if match:   # If so, check if the special symbol is already defined in the dictionary and make the substitution
-        if match.group(1) in cd.keys():
-          cd[i] = re.sub(self.pat, cd[match.group(1)], cd[i])
-    return cd
+    # The Huffman tree only gives the length of every codeword: lengths are limited to MAX_CODE_LEN
+    # and canonical codewords are then assigned from them
+    if not freqs:   # An empty file still gets a 1-bit codeword for symbol 0, so that its header is valid
+      freqs = [(0, 0)]
+    heap = [(freq, i, symb) for i, (freq, symb) in enumerate(freqs)]   # Priority queue of (frequency, tiebreak, node)
+    heapq.heapify(heap)
+    counter = len(heap)   # Tiebreak for the merged nodes, so that nodes themselves are never compared
+    while len(heap) > 1:    # While there is more than one tree in the queue
+      freq0, _, node0 = heapq.heappop(heap)   # Take the 2 least common nodes
+      freq1, _, node1 = heapq.heappop(heap)
+      heapq.heappush(heap, (freq0 + freq1, counter, (node0, node1)))   # Group them together under a new node
+      counter += 1
+    n_codes = [0] * 256   # Number of codewords of every length
+    stack = [(heap[0][2], 0)]    # Walk the tree from the root, keeping the depth of each node
+    while stack:
+      node, node_len = stack.pop()
+      if isinstance(node, tuple):
+        stack.append((node[0], node_len + 1))
+        stack.append((node[1], node_len + 1))
+      else:   # Leaf: count its length (a lone symbol still needs 1 bit)
+        n_codes[max(node_len, 1)] += 1
+    # Shorten codewords longer than MAX_CODE_LEN as libjpeg does: two sibling codewords of the longest
+    # length are replaced by their parent, which takes one of them, while the other one moves under a
+    # shorter codeword, which is split in two. The tree stays complete, so the code stays prefix free
+    for i in range(255, MAX_CODE_LEN, -1):
+      while n_codes[i] > 0:
+        j = i - 2
+        while n_codes[j] == 0:    # Find the longest codeword that can be split
+          j -= 1
+        n_codes[i] -= 2
+        n_codes[i - 1] += 1
+        n_codes[j + 1] += 2
+        n_codes[j] -= 1
+    code = np.zeros(256, dtype = np.uint64)
+    clen = np.zeros(256, dtype = np.uint8)
+    lengths = [length for length in range(1, MAX_CODE_LEN + 1) for _ in range(n_codes[length])]
+    next_code, prev_len = 0, lengths[0]
+    for length, (_, symb) in zip(lengths, sorted(freqs, key = lambda f: (-f[0], f[1]))):    # Shortest codewords to most common symbols
+      next_code <<= length - prev_len   # Canonical code: next codeword of this length, extended with zeros
+      code[symb] = next_code
+      clen[symb] = length
+      next_code += 1
+      prev_len = length
+    return code, clen
+
+ 
+  @staticmethod
+  def make_header(clen):
+    # Make header of compressed file such that:
+    # - The first byte indicates the amount of padding (added by Encode)
+    # - The second byte is the number n of symbols in the source subtracted by 1 to account for range [1,256]
+    # - The next 2n bytes are two bytes for each symbol containing [symbol, number of bits of codeword]
+    # - The codewords of the n symbols follow in the same order, packed MSB first without byte alignment,
+    #   and the encoded data starts right after the last codeword bit
 
-  def create_encoder_dictionary(self, freqs):
     # Inputs:
-    # freqs: frequency tuples of the form (count, symbol)
+    # clen: number of bits of the codeword of every symbol
 
     # Outputs:
-    # final_codes: encoding dictionary
-
-    ptr = 0   # Pointe to run through the codesnames list
-    codes = {}    # Dictionary to store the codes generated
-    final_codes = {}    # Dictionary to store the final codes
-    while len(freqs) > 2:   # While there are more than 3 symbols being encoded
-      last = freqs[-2:]   # Take least common symbols to group together
-      top = freqs[:-2]    # The remaining of the symbols to be kept on the table
-      new_freq = last[0][0] + last[1][0]    # Group the frequencies of the least 2 common symbols into one
-      codes[last[0][1]] = self.codesnames[ptr] + '0'  # Create special code and assign 
-      codes[last[1][1]] = self.codesnames[ptr] + '1'  # code+0 and code+1 for the symbols
-      freqs = top + [(new_freq, self.codesnames[ptr])]    # Substitute least common symbols with new symbol
-      freqs.sort(key = operator.itemgetter(0), reverse = True)    # Sort frequencies from highest to lowest
-      codes = self.update_dictionary(codes)   # Update codes dictionary with previously created symbols
-      ptr += 1
-    codes[freqs[0][1]] = '0'    # Assign values 0 and 1 to last 2 symbols
-    codes[freqs[1][1]] = '1'
-    codes = self.update_dictionary(codes)   # Last update to dictionary
-    for i in codes:
-        if not re.match(self.pat, i):
-            final_codes[i] = codes[i]   # Form final encoder without the special codes used for the table
-    return final_codes
+    # header: bytes of the header of the compressed file, without the codewords
+
+    symbs = np.flatnonzero(clen)    # Symbols present in the source
+    header = np.empty(1 + 2*symbs.size, dtype = np.uint8)
+    header[0] = symbs.size - 1    # Add n_symbols to header
+    header[1::2] = symbs    # Add [symbol, number of bits of codeword] for each symbol
+    header[2::2] = clen[symbs]
+    return header.tobytes()
 
- 
   @staticmethod
-  def make_header(bin_string, encoder_dict):
-    # Make header of compressed file such that:
-    # - The first byte indicates the amount of padding
-    # - The second byte is the number n of symbols in the source subtracted by 1 to account for range [1,256]
-    # - The next 3n bytes are three bytes for each symbol containing [symbol, number of bits of codeword, codeword]
+  def make_lookup_tables(symbs, codes, code_lens):
+    # Make two-level lookup tables for decoding, such that:
+    # - The first primary_bits bits of the stream index the first level: a window starting with a short
+    #   codeword maps to that codeword's symbol and number of bits
+    # - Windows that are the prefix of longer codewords have 0 bits and point to a second level table
+    #   at sub_offset, indexed by the next sub_bits bits of the stream
+    # As codewords are at most MAX_CODE_LEN = 2*PRIMARY_BITS bits long, every second level table has at most
+    # 2**PRIMARY_BITS entries, which keeps the tables small even when the longest codeword is long
 
     # Inputs:
-    # bin_string: encoded binary string
-    # encoder_dict: encoding dictionary
+    # symbs: symbols of the source
+    # codes: codeword of every symbol as an integer
+    # code_lens: number of bits of the codeword of every symbol
 
     # Outputs:
-    # header: header of the compressed file
+    # lut_symb, lut_len: symbol and number of bits for every entry of both levels
+    # sub_offset, sub_bits: position and index bits of the second level table of every first level entry
+    # primary_bits: number of bits of the first level index
 
-    header = ''
-    n_symbols = len(encoder_dict) - 1
-    header += BitArray(uint = n_symbols, length = 8).bin    # Add n_symbols to header
-    for i in encoder_dict:    # For each symbol in the encoder
-      n_bits = len(encoder_dict[i])   # Number of bits of the code
-      header += f'{i}{BitArray(uint = n_bits, length = 8).bin}{encoder_dict[i]}'  # Add [symbol, number of bits of codeword, codeword]
-    return header  
+    primary_bits = min(PRIMARY_BITS, max(code_lens))
+    sub_bits = np.zeros(1 << primary_bits, dtype = np.int64)
+    for code, code_len in zip(codes, code_lens):    # Size second level tables for the longest codeword of each prefix
+      if code_len > primary_bits:
+        prefix = code >> (code_len - primary_bits)
+        sub_bits[prefix] = max(sub_bits[prefix], code_len - primary_bits)
+    sub_sizes = np.where(sub_bits > 0, 1 << sub_bits, 0)
+    sub_offset = (1 << primary_bits) + np.cumsum(sub_sizes) - sub_sizes
+    lut_symb = np.zeros((1 << primary_bits) + int(sub_sizes.sum()), dtype = np.uint8)
+    lut_len = np.zeros(lut_symb.size, dtype = np.uint8)
+    for symb, code, code_len in zip(symbs, codes, code_lens):
+      if code_len <= primary_bits:
+        first = code << (primary_bits - code_len)   # First window starting with the codeword
+        n_windows = 1 << (primary_bits - code_len)
+      else:
+        prefix = code >> (code_len - primary_bits)
+        rest_len = code_len - primary_bits
+        first = sub_offset[prefix] + ((code & ((1 << rest_len) - 1)) << (sub_bits[prefix] - rest_len))
+        n_windows = 1 << (sub_bits[prefix] - rest_len)
+      lut_symb[first:first + n_windows] = symb
+      lut_len[first:first + n_windows] = code_len
+    return lut_symb, lut_len, sub_offset, sub_bits, primary_bits
 
-  def Encode(self, file):
+  def Encode(self, file, out):
     # Inputs:
     # file: file to be encoded
+    # out: binary file object where the Huffman compressed representation of the file is written
 
     # Outputs:
-    # encoded_string: string of bits with the Huffman compressed representation of the file
-
-    bitlist = self.read_bytes(file)    # Get list of bits
-    freqs = self.make_frequency_tuples(bitlist)   # Make frequency table
-    encoder_dict = self.create_encoder_dictionary(freqs)    # Create encoding dictionary
-    orig_encoded_string = ''
-    for i in bitlist:   # Encode each symbol on the list
-      orig_encoded_string += encoder_dict[i]
-    header = self.make_header(orig_encoded_string, encoder_dict) # Create and add header for encoded string
-    encoded_string = header + orig_encoded_string
-    n_pad = 8 - len(encoded_string)%8
-    encoded_string = f'{BitArray(uint = n_pad, length = 8).bin}{encoded_string}{"0"*n_pad}'
-    assert len(encoded_string)%8 == 0
+    # encoded_size: number of bytes written to out
+
+    # The file is read twice, a chunk at a time: once to count the symbols and once to encode them,
+    # so memory use does not grow with the size of the file
+    freqs = self.make_frequency_tuples(self.read_bytes(file))   # Make frequency table
+    code, clen = self.create_code_arrays(freqs)    # Create encoding arrays
+    header = self.make_header(clen) # Create header for encoded bytes
+    # The size of the output is known from the symbol counts, so the padding is written before the data
+    n_bits = int(clen.sum()) + sum(count * int(clen[symb]) for count, symb in freqs)   # Codewords in the header and in the data
+    out.write(bytes([(-n_bits) % 8]))   # First byte is the amount of padding
+    out.write(header)
+    # The codewords of the header are the encoding of its own symbols, so both go through the same bit buffer,
+    # which is kept from one chunk to the next
+    head_symbs = np.frombuffer(header[1::2], dtype = np.uint8)
+    encode_core = _encode_core if HAS_NUMBA else _encode_packbits
+    chunk_out = np.empty((CHUNK_SIZE * int(clen.max()) + 64) // 64 * 8, dtype = np.uint8)    # Encoded bytes of a chunk
+    put_buffer, free_bits = np.uint64(0), 64
+    for chunk in itertools.chain([head_symbs], self.read_bytes(file)):
+      pos, put_buffer, free_bits = encode_core(chunk, code, clen, np.uint64(put_buffer), free_bits, chunk_out, 0)
+      out.write(chunk_out[:pos])
+    n_last = (71 - free_bits) // 8    # Bytes of the buffer that hold bits
+    out.write(int(put_buffer).to_bytes(8, 'big')[:n_last])    # Flush the buffer, already padded with zeros
     # Store variables as instance variables
-    self.orig_encoded_string = orig_encoded_string
     self.freqs = freqs    
-    self.encoder_dict = encoder_dict
-    self.bitlist = bitlist
-    self.encoded_string = encoded_string
-    return encoded_string
+    self.code = code
+    self.clen = clen
+    return 1 + len(header) + (n_bits + 7)//8
 
   @staticmethod
-  def Decode(encoded_bin_string):
+  def Decode(encoded_bytes):
     # Inputs:
-    # encoded_bin_string: encoded representation of a file
+    # encoded_bytes: encoded representation of a file
 
     # Outputs:
-    # decoded_string: binary string with the decoded binary form of the encoded file
-
-    n_pad = BitArray(bin=encoded_bin_string[:8]).uint   # Check padding
-    n_symb = BitArray(bin=encoded_bin_string[8:16]).uint + 1    # Check number of symbols
-    head = encoded_bin_string[:16]    # Obtain first 2 bytes of header (n_pad, n_symb)
-    code2symb = {}
-    # Progressively remove header and its informations from the string
-    bin_to_decompress = encoded_bin_string[16:]   
-    for _ in range(n_symb):   # Loop to get informations from header symbol by symbol and remove it from string to be decompressed
-      symb = bin_to_decompress[:8]    # Get the current symbol
-      n_bits = BitArray(bin=bin_to_decompress[8:16]).uint   # Get the codewords number of bits
-      code = bin_to_decompress[16:16+n_bits]    # Get codeword
-      code2symb[code] = symb    # Add pair {codeword:symbol} to decompression dictionary
-      # Add elements already processed to header and remove them from main string
-      head += bin_to_decompress[:16+n_bits]   
-      bin_to_decompress = bin_to_decompress[16+n_bits:]
-    if n_pad>0:   # Remove padding from encoded string
-      bin_to_decompress = bin_to_decompress[:-n_pad]
-    symb_being_decoded = ''   # Variable to keep track of the current code being decoded
-    decoded_string = ''   # Final decoded string
-    for i in bin_to_decompress:   # Iterate over every bit on string without the header
-      symb_being_decoded += i   # Add current symbol to variable
-      # Check if code is in the decoding dictionary, if so, add its symbol to decoded string
-      # and reinitialize tracking variable, but if not, keep adding bits until it is found in the dictionary
-      if symb_being_decoded in code2symb:   
-        decoded_string += code2symb[symb_being_decoded]
-        symb_being_decoded = ''
-    return decoded_string
+    # decoded_bytes: bytes of the decoded file
+
+    n_pad = encoded_bytes[0]   # Check padding
+    n_symb = encoded_bytes[1] + 1    # Check number of symbols
+    symbs = encoded_bytes[2:2+2*n_symb:2]   # Get the symbols
+    code_lens = encoded_bytes[3:3+2*n_symb:2]   # Get the codewords number of bits
+    # Check that the lengths describe a complete prefix code (Kraft sum of exactly 1),
+    # as create_code_arrays always makes, so the lookup tables leave no entry undefined
+    if len(set(symbs)) != n_symb:
+      raise ValueError('repeated symbols in the header')
+    if min(code_lens) == 0 or max(code_lens) > MAX_CODE_LEN:
+      raise ValueError(f'codeword lengths must be between 1 and {MAX_CODE_LEN} bits')
+    if n_symb == 1:
+      complete = code_lens[0] == 1    # A lone symbol always gets a 1-bit codeword
+    else:
+      complete = sum(1 << (MAX_CODE_LEN - code_len) for code_len in code_lens) == 1 << MAX_CODE_LEN
+    if not complete:
+      raise ValueError('codeword lengths do not form a complete prefix code')
+    # Get the codewords, which are packed right after the table of symbols
+    code_pos = 2 + 2*n_symb   # Byte where the codewords start
+    n_code_bits = sum(code_lens)
+    codes = []
+    pos = 8 * code_pos    # Bit position of the current codeword
+    for code_len in code_lens:    # Read only the bytes holding each codeword, without copying the rest
+      first, last = pos // 8, (pos + code_len + 7) // 8
+      window = int.from_bytes(encoded_bytes[first:last], 'big')
+      codes.append((window >> (8*last - pos - code_len)) & ((1 << code_len) - 1))
+      pos += code_len
+    lut_symb, lut_len, sub_offset, sub_bits, primary_bits = HuffmanCode.make_lookup_tables(symbs, codes, code_lens)
+    byte_pos = code_pos + n_code_bits // 8   # Byte where the encoded data starts
+    n_total = 8 * (len(encoded_bytes) - byte_pos) - n_code_bits % 8 - n_pad    # Number of bits to decode
+    if n_total <= 0:
+      return b''
+    compressed = np.frombuffer(encoded_bytes, dtype = np.uint8)
+    decoded_bytes = _decode_core(compressed, byte_pos, n_code_bits % 8, n_total, lut_symb, lut_len,
+                                 sub_offset, sub_bits, primary_bits, max(code_lens), min(code_lens))
+    return decoded_bytes.tobytes()
 
   def Compress(self, file, output_path, evaluate_time = True):
     # Inputs:
@@ -189,10 +373,12 @@ class HuffmanCode:
       os.mkdir(output_path)
     filename = os.path.splitext(os.path.basename(file))[0]   # Create compressed file name
     compressed_file = os.path.join(output_path, f'{filename}_compressed.bin')
-    encoded_string = self.Encode(file)    # Encode file
-    with open(compressed_file, 'wb') as out:    # Use encoded string to create compressed file
-    # Importante to note that the method .tofile() of class bitstring.BitArray automatically pads the input binary data
-      BitArray(bin = encoded_string).tofile(out)
+    try:
+      with open(compressed_file, 'wb') as out:    # Encode file straight into the compressed file
+        self.Encode(file, out)
+    except BaseException:   # Do not leave a partial compressed file behind
+      os.remove(compressed_file)
+      raise
     e = time()
     if evaluate_time:
       print(f'{filename} compressed in {int(e-s)}s')
@@ -211,20 +397,14 @@ class HuffmanCode:
     s = time()    # Evaluate time
     if not os.path.isdir(output_path):    # Create Decompressed directory if it does'nt already exist
       os.mkdir(output_path)
-    match = re.match(r"(.*)_compressed", os.path.splitext(os.path.basename(compressed_file))[0])
-    filename = match.group(1)
+    filename = os.path.splitext(os.path.basename(compressed_file))[0]
+    filename = filename[:filename.rindex('_compressed')]   # Strip the suffix added on compression
     decompressed_file = os.path.join(output_path, f'{filename}_decompressed{extension}')
-    with open(compressed_file, 'rb') as f:    # Obtain string of bits from the compressed file
-      encoded_bin_string = ''
-      while True:
-        byte = f.read(1)
-        if byte:
-          encoded_bin_string += BitArray(byte).bin
-        else:
-          break
-    decoded_string = self.Decode(encoded_bin_string)    # Decode the string
+    with open(compressed_file, 'rb') as f:    # Obtain bytes from the compressed file
+      encoded_bytes = f.read()
+    decoded_bytes = self.Decode(encoded_bytes)    # Decode the bytes
     with open(decompressed_file, 'wb') as out:    # Decode file
-      BitArray(bin = decoded_string).tofile(out)
+      out.write(decoded_bytes)
     e = time()
     if evaluate_time:
       print(f'{filename} decompressed in {int(e-s)}s')